@@ -7,12 +7,22 @@ Created on Mon Mar  3 20:12:56 2025
 Implements API Client class for access Environmental Agency Flood Risk API
 """
 
-from utils import dt_to_str, str_to_dt, get_time_24hrs_ago
+from utils import get_time_24hrs_ago, map_concurrently, json_loads
+from collections import OrderedDict
+from functools import lru_cache, partial
+from itertools import chain
+from operator import itemgetter
 from datetime import datetime
+from urllib.parse import parse_qs, urlencode, urlsplit
+import logging
+import threading
 import requests
-import matplotlib.pyplot as plt
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import numpy as np
 import pandas as pd
 
+logger = logging.getLogger(__name__)
 
 MEASURE_TYPES = {
     "level": "Water level, see qualifier for whether stage or downstream of the stage, see unitName for whether relative to the stage datum (mASD) or to the ordnance datum.",
@@ -24,30 +34,78 @@ MEASURE_TYPES = {
 
 class APIClient:
 
+    __slots__ = ("_session", "_cache", "_validators", "_validators_lock")
+
     STATIONS_ENDPOINT = "id/stations"
     STATION_ENDPOINT = "id/stations/?stationReference={station_id}"
     MEASURES_ENDPOINT = "id/stations/{station_id}/measures"
-    DATE_FILTER_ENDPOINT = (
-        "/id/stations/{station_id}/readings?startdate={start_date}&enddate={end_date}"
-    )
-    DATE_SINCE_FILTER_ENDPOINT = "/id/stations/{station_id}/readings?since={start_date}"
-    READINGS_SINCE_FILTER = "/readings?since={start_date}"
-    READINGS_DATE_FILTER = "/readings?startdate={start_date}&enddate={end_date}"
+    SEARCH_ENDPOINT = "id/stations?{query}"
+    DATE_FILTER_ENDPOINT = "/id/stations/{station_id}/readings?{query}"
+    READINGS_DATE_FILTER = "/readings?{query}"
     BASE_URL = "https://environment.data.gov.uk/flood-monitoring"
     DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
     DATETIME_FORMAT_DF = "%d-%m-%YT%H:%M:%SZ"
     DATE_FORMAT = "%Y-%m-%d"
+    # Fields of each reading that are used
+    READING_FIELDS = ("dateTime", "value")
 
     # Taken from https://environment.data.gov.uk/flood-monitoring/doc/reference#:~:text=The%20list%20of%20currently%20available%20types%20of%20measurement%20are:
     MEASURE_PARAMETER_NAMES = list(MEASURE_TYPES.keys())
 
-    def get_api_response(self, endpoint_extension: str = None) -> dict:
+    # (connect, read) timeouts in seconds
+    REQUEST_TIMEOUT = (3.05, 30)
+    # Max number of requests in flight at once, kept within the session pool size
+    MAX_CONCURRENT_REQUESTS = 16
+    # Max number of station metadata responses kept in memory
+    CACHE_SIZE = 512
+    # Max number of response bodies kept for revalidating with ETag/Last-Modified
+    VALIDATORS_CACHE_SIZE = 64
+
+    def __init__(self) -> None:
+        # Single session shared by all requests so TCP/TLS connections are kept
+        # alive and reused rather than renegotiated for every endpoint
+        self._session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=16,
+            pool_maxsize=32,
+            max_retries=Retry(
+                total=3,
+                backoff_factor=0.3,
+                status_forcelist=[429, 500, 502, 503, 504],
+            ),
+        )
+        # Measure urls returned by the API (latestReading["measure"]) are http, so
+        # both schemes share the pooled, retrying adapter
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
+        # Station metadata (info, measures, search results) rarely changes so is
+        # cached per client. Readings are always requested fresh. Cached responses
+        # are never requested again so aren't kept for revalidation
+        self._cache = lru_cache(maxsize=self.CACHE_SIZE)(
+            partial(self.get_api_response, revalidate=False)
+        )
+
+        # Conditional request headers and last body for each url that returned an
+        # ETag/Last-Modified, so unchanged resources come back as an empty 304.
+        # Least recently used urls are dropped first. Shared across request threads
+        self._validators = OrderedDict()
+        self._validators_lock = threading.Lock()
+
+    def get_api_response(
+        self,
+        endpoint_extension: str = None,
+        fields: tuple[str] = None,
+        revalidate: bool = True,
+    ) -> dict:
         """
         Defaults to stations list.
-        Note: Returns the 'items' key of the API response
+        Note: Returns the 'items' key of the API response. If fields is given,
+        returns only those fields of each item as a tuple of lists (one per field).
+        If revalidate, the response is kept so a repeat request can be answered
+        with a 304
         """
 
-        session = requests.Session()
         if endpoint_extension is None:
             endpoint_extension = "id/stations"
         else:
@@ -59,63 +117,104 @@ class APIClient:
         else:
             endpoint = endpoint_extension
 
-        # print(f"Requesting endpoint: {endpoint}")
-        response = session.get(endpoint)
-        response.raise_for_status()
-        out = response.json()["items"]
+        logger.debug("Requesting endpoint: %s", endpoint)
+        content = self._get_content(endpoint, revalidate=revalidate)
+        logger.debug("Successful request: %s", endpoint)
+        out = json_loads(content)["items"]
         if len(out) == 0:
             return None
+        elif fields is not None:
+            # Project straight into columns so the item dicts can be freed
+            return tuple(list(map(itemgetter(f), out)) for f in fields)
         else:
             return out
 
-    def check_valid_station_id(self, station_id: str) -> None:
-        """Ceheck if station id is valid"""
-        endpoint = self.STATION_ENDPOINT.format(station_id=station_id)
-        station_info = self.get_api_response(endpoint)
+    def _get_content(self, endpoint: str, revalidate: bool = True) -> bytes:
+        """Requests endpoint, revalidating the body from an earlier response for
+        the same url if the API gave it an ETag or Last-Modified header"""
+        with self._validators_lock:
+            headers, content = self._validators.get(endpoint, (None, None))
+            if headers is not None:
+                self._validators.move_to_end(endpoint)
 
-        assert (
-            len(station_info) > 0
-        ), f"Station id: {station_id} not found! Ensure id is correct"
+        response = self._session.get(
+            endpoint, headers=headers, timeout=self.REQUEST_TIMEOUT
+        )
+        if response.status_code == 304:
+            return content
+        response.raise_for_status()
+
+        # "since" readings urls hold the current time so are never requested again
+        if not revalidate or "since" in parse_qs(urlsplit(endpoint).query):
+            return response.content
+
+        validators = {}
+        if "ETag" in response.headers:
+            validators["If-None-Match"] = response.headers["ETag"]
+        if "Last-Modified" in response.headers:
+            validators["If-Modified-Since"] = response.headers["Last-Modified"]
+        if validators:
+            with self._validators_lock:
+                self._validators[endpoint] = (validators, response.content)
+                self._validators.move_to_end(endpoint)
+                if len(self._validators) > self.VALIDATORS_CACHE_SIZE:
+                    self._validators.popitem(last=False)
+
+        return response.content
+
+    def get_api_responses(
+        self, endpoint_extensions: list[str], fields: tuple[str] = None
+    ) -> list:
+        """Requests several endpoints concurrently over the shared session.
+        Returns the get_api_response result of each endpoint, in the same order"""
+        return map_concurrently(
+            partial(self.get_api_response, fields=fields),
+            endpoint_extensions,
+            max_workers=self.MAX_CONCURRENT_REQUESTS,
+        )
+
+    def get_cached_api_response(self, endpoint_extension: str = None) -> dict:
+        """Same as get_api_response but reuses earlier responses for the same
+        endpoint. Returned data is shared so must not be modified by callers"""
+        return self._cache(endpoint_extension)
 
-    def get_station_measures(self, station_id: int) -> tuple[list[str]]:
-        """Get all measurements taken at a station."""
+    def get_station_measures(self, station_id: int) -> dict[str, dict]:
+        """Get all measurements taken at a station.
+        Returns {measure name: {"endpoint": ..., "unit": ..., "qualifier": ...}}.
+        Only the first measure of each type with a latest reading is kept.
+        Also serves as the station id check, as unknown stations have no measures"""
         endpoint = self.MEASURES_ENDPOINT.format(station_id=station_id)
-        data = self.get_api_response(endpoint)
+        data = self.get_cached_api_response(endpoint)
 
-        station_measures = list(
-            {d["parameter"] for d in data if d.get("latestReading", False)}
-        )
-        station_measures_eps = list(
-            {
-                d["latestReading"]["measure"]
-                for d in data
-                if d.get("latestReading", False)
+        assert (
+            data is not None
+        ), f"Station id: {station_id} not found! Ensure id is correct"
+
+        station_measures = {}
+        for d in data:
+            latest_reading = d.get("latestReading")
+            if not latest_reading or d["parameter"] in station_measures:
+                continue
+            station_measures[d["parameter"]] = {
+                "endpoint": latest_reading["measure"],
+                "unit": d["unitName"],
+                "qualifier": d["qualifier"],
             }
-        )
-        station_measues_unit = list(
-            {d["unitName"] for d in data if d.get("latestReading", False)}
-        )
-        station_measues_qualifiers = list(
-            {d["qualifier"] for d in data if d.get("latestReading", False)}
-        )
 
-        return (
-            station_measures,
-            station_measures_eps,
-            station_measues_unit,
-            station_measues_qualifiers,
-        )
+        return station_measures
 
     def get_station_info(self, station_id: int) -> dict:
         endpoint = self.STATION_ENDPOINT.format(station_id=station_id)
-        return self.get_api_response(endpoint)
+        return self.get_cached_api_response(endpoint)
 
-    def check_station_measure(self, station_id: int, measure_name: str) -> None:
-        """Checks if measurement is taken at given station (id)"""
-        station_measures, _, _, _ = self.get_station_measures(station_id)
+    def check_station_measure(
+        self, station_measures: dict[str, dict], measure_name: str
+    ) -> None:
+        """Checks if measurement is taken at a station, given the station measures
+        from get_station_measures"""
         assert (
             measure_name in station_measures
-        ), f"Station does not measure: {measure_name}. Valid station measures are {station_measures}"
+        ), f"Station does not measure: {measure_name}. Valid station measures are {list(station_measures)}"
 
     def station_name_to_ids(
         self, station_name: str, print_on_error: bool = True
@@ -123,10 +222,10 @@ class APIClient:
         """Gets list of station ids that (partially) match the given station name.
         Returns list of station ids and associated station names"""
 
-        station_name = "+".join(station_name.split(" "))
-
-        endpoint_ext = f"id/stations?search={station_name}"
-        data = self.get_api_response(endpoint_ext)
+        endpoint_ext = self.SEARCH_ENDPOINT.format(
+            query=urlencode({"search": station_name})
+        )
+        data = self.get_cached_api_response(endpoint_ext)
         if data is None:
             if print_on_error:
                 print(
@@ -139,59 +238,58 @@ class APIClient:
 
             return list(names), list(ids)
 
+    def station_names_to_ids_bulk(
+        self, station_names: list[str]
+    ) -> list[tuple[list, list]]:
+        """Searches for several station names concurrently.
+        Returns station_name_to_ids result of each station name, in the same order"""
+        return map_concurrently(
+            lambda n: self.station_name_to_ids(n, print_on_error=False),
+            station_names,
+            max_workers=self.MAX_CONCURRENT_REQUESTS,
+        )
+
     def check_is_valid_measure(self, measure_name: str) -> None:
         # measure_name = measure_name.lower()
         assert (
             measure_name in self.MEASURE_PARAMETER_NAMES
         ), f"Measure: {measure_name} is not valid. Use one of {self.MEASURE_PARAMETER_NAMES}"
 
-    def create_date_filter_endpoint(
-        self, station_id: int, start_end_date: tuple[datetime, datetime | None]
+    def create_date_filter_query(
+        self, start_end_date: tuple[datetime, datetime | None]
     ) -> str:
-        """Creates a reading date filter based on station id"""
+        """Creates the url encoded query string of a reading date filter"""
 
         start_date, end_date = start_end_date
 
         # Use start-end filter
         if end_date is not None:
-            s_date = dt_to_str(start_date, self.DATE_FORMAT)
-            e_date = dt_to_str(end_date, self.DATE_FORMAT)
-
-            endpoint = self.DATE_FILTER_ENDPOINT.format(
-                station_id=station_id, start_date=s_date, end_date=e_date
-            )
+            query = {
+                "startdate": start_date.strftime(self.DATE_FORMAT),
+                "enddate": end_date.strftime(self.DATE_FORMAT),
+            }
 
         # Use since filter
         else:
-            s_date = dt_to_str(start_date, self.DATETIME_FORMAT)
-            endpoint = self.DATE_SINCE_FILTER_ENDPOINT.format(
-                station_id=station_id, start_date=s_date
-            )
+            query = {"since": start_date.strftime(self.DATETIME_FORMAT)}
+
+        return urlencode(query)
 
-        return endpoint
+    def create_date_filter_endpoint(
+        self, station_id: int, start_end_date: tuple[datetime, datetime | None]
+    ) -> str:
+        """Creates a reading date filter based on station id"""
+        return self.DATE_FILTER_ENDPOINT.format(
+            station_id=station_id, query=self.create_date_filter_query(start_end_date)
+        )
 
     def create_reading_date_filter_endpoint(
         self, start_end_date: tuple[datetime, datetime | None]
     ) -> str:
         """Creates a reading date filter based on reading endpoint"""
-
-        start_date, end_date = start_end_date
-
-        # Use start-end filter
-        if end_date is not None:
-            s_date = dt_to_str(start_date, self.DATE_FORMAT)
-            e_date = dt_to_str(end_date, self.DATE_FORMAT)
-
-            endpoint = self.READINGS_DATE_FILTER.format(
-                start_date=s_date, end_date=e_date
-            )
-
-        # Use since filter
-        else:
-            s_date = dt_to_str(start_date, self.DATETIME_FORMAT)
-            endpoint = self.READINGS_SINCE_FILTER.format(start_date=s_date)
-
-        return endpoint
+        return self.READINGS_DATE_FILTER.format(
+            query=self.create_date_filter_query(start_end_date)
+        )
 
     def get_station_readings(
         self,
@@ -207,88 +305,60 @@ class APIClient:
         if measure_name is not None:
             self.check_is_valid_measure(measure_name)
 
-        # Check station id is valid
-        self.check_valid_station_id(station_id)
-
-        # Check station collects this particular measurement
-        if measure_name is not None:
-            self.check_station_measure(station_id, measure_name)
+        # Get all measures, reused below to validate and filter the measure. Also
+        # checks station id is valid
+        station_measures = self.get_station_measures(station_id)
 
         # If measure name is provided get only that measure
         if measure_name is not None:
-            # Get all measures
-            (
-                station_measures,
-                station_measures_eps,
-                station_measues_units,
-                station_measues_qualifiers,
-            ) = self.get_station_measures(station_id)
-
-            # Filter down for measure of interest
-            endpoints = [
-                ep
-                for (ep, m) in zip(station_measures_eps, station_measures)
-                if m == measure_name
-            ]
-            units = [
-                unit
-                for (unit, m) in zip(station_measues_units, station_measures)
-                if m == measure_name
-            ]
-            qualifiers = [
-                q
-                for (q, m) in zip(station_measues_qualifiers, station_measures)
-                if m == measure_name
-            ]
-            measure_names = [measure_name]
-
-        # If no measure name is provided get all readings
-        else:
-            measure_names, endpoints, units, qualifiers = self.get_station_measures(
-                station_id
-            )
+            # Check station collects this particular measurement
+            self.check_station_measure(station_measures, measure_name)
+
+            station_measures = {measure_name: station_measures[measure_name]}
+
+        measure_names = list(station_measures)
+        endpoints = [info["endpoint"] for info in station_measures.values()]
 
         reading_date_filter = self.create_reading_date_filter_endpoint(
             start_end_date=start_end_date
         )
         endpoints = [ep + reading_date_filter for ep in endpoints]
 
-        dfs = []
-        for measure, endpoint in zip(measure_names, endpoints):
-            data = self.get_api_response(endpoint)
+        measurements = {}
+        readings = self.get_api_responses(endpoints, fields=self.READING_FIELDS)
+        for measure, data in zip(measure_names, readings):
             if data is not None:
-                dfs += [self.post_process_station_measurement_data(data, measure)]
+                measurements[measure] = self.post_process_station_measurement_data(data)
 
         measurement_info = {
-            m: {"qualifier": q, "unit": u, "name": station_name, "measurement_name": m}
-            for m, q, u in zip(measure_names, qualifiers, units)
+            m: {
+                "qualifier": info["qualifier"],
+                "unit": info["unit"],
+                "name": station_name,
+                "measurement_name": m,
+            }
+            for m, info in station_measures.items()
         }
 
-        return pd.concat(dfs, axis=1), measurement_info
+        return self.create_measurement_df(measurements), measurement_info
 
-    def get_station_measure_info(self, station_id: int, measure_name: str):
-
-        (
-            station_measures,
-            station_measures_eps,
-            station_measues_unit,
-            station_measues_qualifiers,
-        ) = self.get_station_measures(station_id)
+    def get_station_measure_info(self, station_id: int, measure_name: str) -> dict:
+        """Get endpoint, unit and qualifier of a measure taken at a station"""
+        station_measures = self.get_station_measures(station_id)
+        self.check_station_measure(station_measures, measure_name)
+        return station_measures[measure_name]
 
     def post_process_station_measurement_data(
         self,
-        data: dict,
-        measurement_name: str,
-    ) -> pd.DataFrame:
+        data: tuple[list[str], list[float]],
+    ) -> tuple[list[str], np.ndarray]:
+        """Converts (dateTime, value) columns of a readings response, see
+        READING_FIELDS, to date strings and array of values. Dates are parsed
+        in create_measurement_df"""
 
-        dates, values = zip(
-            *[
-                (str_to_dt(d["dateTime"], self.DATETIME_FORMAT), d["value"])
-                for d in data
-            ]
-        )
+        date_strs, values = data
 
-        return self.create_measurement_df(dates, values, measurement_name)
+        return date_strs, np.asarray(values, dtype=np.float64)
 
     def get_all_station_ids(
         self,
@@ -300,16 +370,36 @@ class APIClient:
 
     def create_measurement_df(
         self,
-        dates: list[datetime],
-        measurements: list[float],
-        measurement_name: str = "Measurement",
+        measurements: dict[str, tuple[list[str], np.ndarray]],
     ) -> pd.DataFrame:
+        """Creates a single DataFrame from {measurement name: (date strings, values)}.
+        Measurements are aligned on the union of their dates, with NaN where a
+        measurement has no reading at a date"""
+
+        if len(measurements) == 0:
+            return pd.DataFrame(columns=["Date"])
+
+        # Parse the dates of all measurements in one call. Measurements at a
+        # station mostly share timestamps, which cache=True parses only once
+        dates = pd.to_datetime(
+            list(chain.from_iterable(d for d, _ in measurements.values())),
+            format=self.DATETIME_FORMAT,
+            cache=True,
+        )
+
+        # Sorted union of all dates and the position of each reading within it
+        all_dates, positions = np.unique(dates.to_numpy(), return_inverse=True)
+        split_idxs = np.cumsum([len(d) for d, _ in measurements.values()])[:-1]
 
-        df = pd.DataFrame({"Date": dates, measurement_name: measurements})
-        df["Date"] = pd.to_datetime(df["Date"], format=self.DATETIME_FORMAT_DF)
-        df = df.sort_values(by="Date")
+        columns = {}
+        for (measurement_name, (_, values)), idxs in zip(
+            measurements.items(), np.split(positions, split_idxs)
+        ):
+            column = np.full(len(all_dates), np.nan)
+            column[idxs] = values
+            columns[measurement_name] = column
 
-        return df
+        return pd.DataFrame({"Date": all_dates, **columns})
 
     def get_station_name_from_id(self, station_id: str) -> str:
         data = self.get_station_info(station_id)
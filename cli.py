@@ -8,13 +8,20 @@ Implements all CLI commands for interacting with the EA API.
 """
 
 import random
+from datetime import datetime
+from typing import Any, Callable
+import pandas as pd
 from plotting import plot_time_series
 import tabulate
-from utils import str_to_dt, get_time_24hrs_ago
+from utils import get_time_24hrs_ago, map_concurrently
 from api_client import APIClient, MEASURE_TYPES
 
 MAX_PRINT_ROWS = 30
 
+# Stations whose readings are fetched at once. Each station also fetches its
+# measures concurrently, so this keeps the total within the APIClient pool size
+MAX_CONCURRENT_STATIONS = 8
+
 ACRONYMS = {
     "mAOD": "Metres relative to the Ordnance Survey datum",
     "mASD": "Metres relative to the local stage datum",
@@ -60,7 +67,7 @@ def process_sep_string(long_string: str) -> list[str]:
 # ============================================================================= #
 def get_random_station_id(api_client: APIClient) -> tuple[str, str]:
     all_station_ids, all_station_names = api_client.get_all_station_ids()
-    r = random.randint(0, len(all_station_ids))
+    r = random.randrange(len(all_station_ids))
     return all_station_ids[r], all_station_names[r]
 
 
@@ -68,19 +75,36 @@ def get_random_station_id(api_client: APIClient) -> tuple[str, str]:
 
 
 # ============================================================================= #
-def _print_station_measures(
-    api_client: APIClient, station_id: str, station_name: str
-) -> None:
+def _fetch_for_stations(
+    func: Callable[[Any], Any], stations: list[Any], max_workers: int = 16
+) -> list[Any]:
     """
-    Fetches and prints available measures at a station.
+    Calls func (e.g. APIClient.get_station_measures) for all stations (station ids
+    or other per station arguments) concurrently. Returns the result for each
+    station, or the exception raised if that call failed, so results can then be
+    printed one station at a time.
     """
-    try:
-        measures, _, units, qualifiers = api_client.get_station_measures(station_id)
-        print(f"\nAvailable Measures at {station_name}:")
-        for measure, unit, qualifier in zip(measures, units, qualifiers):
-            print(f"\t{measure} (Qualifier: {qualifier}, Unit: {unit})")
-    except Exception as e:
-        print(f"Error fetching station measures: {e}")
+
+    def _call(station: Any) -> Any:
+        try:
+            return func(station)
+        except Exception as e:
+            return e
+
+    return map_concurrently(_call, stations, max_workers=max_workers)
+
+
+# ============================================================================= #
+
+
+# ============================================================================= #
+def _print_station_measures(station_name: str, measures: dict[str, dict]) -> None:
+    """
+    Prints available measures at a station.
+    """
+    print(f"\nAvailable Measures at {station_name}:")
+    for measure, info in measures.items():
+        print(f"\t{measure} (Qualifier: {info['qualifier']}, Unit: {info['unit']})")
 
 
 # ============================================================================= #
@@ -114,11 +138,13 @@ def _fetch_station_readings(
             "Enter end date (DD-MM-YYYY) (optional, press Enter for current date-time): "
         ).strip()
         start_date = (
-            str_to_dt(start_date_str, "%d-%m-%Y")
+            datetime.strptime(start_date_str, "%d-%m-%Y")
             if start_date_str
             else get_time_24hrs_ago()
         )
-        end_date = str_to_dt(end_date_str, "%d-%m-%Y") if start_date_str else None
+        end_date = (
+            datetime.strptime(end_date_str, "%d-%m-%Y") if start_date_str else None
+        )
     else:
         start_date = get_time_24hrs_ago()
         end_date = None
@@ -130,14 +156,25 @@ def _fetch_station_readings(
     else:
         measure = None
 
-    combined_df = None
+    per_station_dfs = []
     combined_measurement_info = {}
 
-    for station_id, station_name in zip(station_ids, station_names):
+    # Fetch all stations concurrently, then combine them in order
+    all_readings = _fetch_for_stations(
+        lambda station: api_client.get_station_readings(
+            *station, (start_date, end_date), measure or None
+        ),
+        list(zip(station_ids, station_names)),
+        max_workers=MAX_CONCURRENT_STATIONS,
+    )
+
+    for station_id, station_name, readings in zip(
+        station_ids, station_names, all_readings
+    ):
         try:
-            readings_df, measurement_info = api_client.get_station_readings(
-                station_id, station_name, (start_date, end_date), measure or None
-            )
+            if isinstance(readings, Exception):
+                raise readings
+            readings_df, measurement_info = readings
 
             if readings_df.empty:
                 print(f"\nNo readings found for station {station_id}.")
@@ -149,27 +186,29 @@ def _fetch_station_readings(
                 if col != "Date"
             }
             readings_df = readings_df.rename(columns=prefixed_columns)
-
-            if combined_df is None:
-                combined_df = readings_df
-            else:
-                combined_df = combined_df.merge(readings_df, on="Date", how="outer")
+            per_station_dfs.append(readings_df.set_index("Date"))
 
             combined_measurement_info.update(
                 {
-                    prefixed_columns[col]: measurement_info[col]
-                    for col in measurement_info
+                    prefixed_col: measurement_info[col]
+                    for col, prefixed_col in prefixed_columns.items()
                 }
             )
 
         except Exception as e:
             print(f"Error fetching station {station_name} ({station_id}) readings: {e}")
 
+    # Join all stations on date once, rather than merging station by station
+    if per_station_dfs:
+        combined_df = (
+            pd.concat(per_station_dfs, axis=1, join="outer").sort_index().reset_index()
+        )
+    else:
+        combined_df = None
+
     if combined_df is None or combined_df.empty:
         print("\nNo data available for the specified station(s).")
     else:
-        combined_df.sort_values(by="Date", inplace=True)
-
         headers = ["Date"] + list(combined_df.columns.drop("Date"))
         print("\n", "-" * 50)
 
@@ -197,25 +236,20 @@ def _fetch_station_readings(
 
 
 # ============================================================================= #
-def _print_station_info(api_client: APIClient, station_id: str) -> None:
+def _print_station_info(station_id: str, station_info: dict) -> None:
     """
-    Fetches and displays station information.
+    Displays station information.
     """
-    try:
-        data = api_client.get_station_info(station_id)
-        print("\n", "-" * 30)
-        print(f"Station ({station_id}) Information:")
-
-        for key, value in data[0].items():
-            if key != "@id":
-                if key == "measures":
-                    print(f"\tMeasures: {[_['parameter'] for _ in value]}")
-                else:
-                    print(f"\t{key.title()} - {value}")
-        print("-" * 30)
+    print("\n", "-" * 30)
+    print(f"Station ({station_id}) Information:")
 
-    except Exception as e:
-        print(f"Error fetching station information: {e}")
+    for key, value in station_info.items():
+        if key != "@id":
+            if key == "measures":
+                print(f"\tMeasures: {', '.join(m['parameter'] for m in value)}")
+            else:
+                print(f"\t{key.title()} - {value}")
+    print("-" * 30)
 
 
 # ============================================================================= #
@@ -285,10 +319,10 @@ def preprocess_station_info(api_client: APIClient) -> tuple[list[str], list[str]
             station_names = []
             station_ids = []
 
-            for n in station_names_pre:
-                print(f"Searching station name '{n}'...")
-                names, ids = api_client.station_name_to_ids(n, print_on_error=False)
+            print(f"Searching station names {station_names_pre}...")
+            search_results = api_client.station_names_to_ids_bulk(station_names_pre)
 
+            for n, (names, ids) in zip(station_names_pre, search_results):
                 if len(names) == 0:
                     cont = (
                         input(
@@ -399,10 +433,13 @@ def fetch_station_readings(api_client: APIClient) -> None:
 def fetch_station_measures(api_client: APIClient) -> None:
     try:
         station_ids, station_names = preprocess_station_info(api_client)
-        [
-            _print_station_measures(api_client, id, name)
-            for id, name in zip(station_ids, station_names)
-        ]
+        all_measures = _fetch_for_stations(api_client.get_station_measures, station_ids)
+
+        for name, measures in zip(station_names, all_measures):
+            if isinstance(measures, Exception):
+                print(f"Error fetching station measures: {measures}")
+            else:
+                _print_station_measures(name, measures)
     except Exception as e:
         print(f"Error: {e}")
 
@@ -414,7 +451,15 @@ def fetch_station_measures(api_client: APIClient) -> None:
 def fetch_station_info(api_client: APIClient) -> None:
     try:
         station_ids, _ = preprocess_station_info(api_client)
-        [_print_station_info(api_client, id) for id in station_ids]
+        all_station_info = _fetch_for_stations(
+            lambda id: api_client.get_station_info(id)[0], station_ids
+        )
+
+        for id, station_info in zip(station_ids, all_station_info):
+            if isinstance(station_info, Exception):
+                print(f"Error fetching station information: {station_info}")
+            else:
+                _print_station_info(id, station_info)
     except Exception as e:
         print(f"Error: {e}")
 
@@ -15,11 +15,30 @@ https://environment.data.gov.uk/flood-monitoring/id/stations/{id}/readings
 
 """
 
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
 from datetime import datetime, timedelta
+from functools import lru_cache
+from urllib.parse import quote_plus, urlencode
+import logging
 import requests
-import matplotlib.pyplot as plt
-import pandas as pd
+from requests.adapters import HTTPAdapter
+from typing import TYPE_CHECKING
 
+try:
+    from orjson import loads as json_loads
+except ImportError:  # orjson is optional, stdlib json also accepts bytes
+    from json import loads as json_loads
+
+# numpy, pandas and matplotlib are slow to import and only needed once readings
+# are processed or plotted, so are imported inside the functions that use them
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+
+
+logger = logging.getLogger(__name__)
 
 BASE_URL = "https://environment.data.gov.uk/flood-monitoring"
 
@@ -30,6 +49,14 @@ MEASURE_PARAMETER_NAMES = ["level", "flow", "wind", "temperature"]
 DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
 DATE_FORMAT = "%Y-%m-%d"
 
+# Shared by all requests so connections are kept alive and reused
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=64))
+
+# Runs the station info and measures lookups side by side. Created once rather than
+# per call as both lookups are usually cache hits
+_EXECUTOR = ThreadPoolExecutor(max_workers=2)
+
 
 def get_time_24hrs_ago() -> datetime:
     """Returns time 24 hours ago"""
@@ -38,16 +65,11 @@ def get_time_24hrs_ago() -> datetime:
     return time_24_hours_ago
 
 
-def dt_to_str(dt: datetime, format: str = DATETIME_FORMAT) -> str:
-    return dt.strftime(format)
-
-
-def str_to_dt(dt_str: datetime, format: str = DATETIME_FORMAT) -> str:
-    return datetime.strptime(dt_str, format)
-
-
-def create_session(endpoint_extension: str = None) -> dict:
-    session = requests.Session()
+def fetch_json(
+    endpoint_extension: str = None, session: requests.Session = None
+) -> dict:
+    if session is None:
+        session = _SESSION
     if endpoint_extension is None:
         endpoint_extension = "id/stations"
     else:
@@ -56,28 +78,42 @@ def create_session(endpoint_extension: str = None) -> dict:
 
     endpoint = f"{BASE_URL}/{endpoint_extension}"
 
-    print(f"Requesting endpoint: {endpoint}")
+    logger.debug("Requesting endpoint: %s", endpoint)
     response = session.get(endpoint)
     response.raise_for_status()
-    print("\tSuccessful request")
-    return response.json()
-
+    logger.debug("Successful request: %s", endpoint)
+    return json_loads(response.content)
 
-def filter_by_station_name(station_name: str) -> dict:
 
-    # Replacing any spaces with "+"'s
-    station_name = "+".join(station_name.split(" "))
+def filter_by_station_name(station_name: str, session: requests.Session = None) -> dict:
 
-    endpoint_ext = f"id/stations?search={station_name}"
-    data = create_session(endpoint_ext)
+    # Spaces become "+"'s and reserved characters (&, ?, ...) are escaped
+    endpoint_ext = f"id/stations?search={quote_plus(station_name)}"
+    data = fetch_json(endpoint_ext, session=session)
 
     return data
 
 
+# Station info and measures rarely change so are cached per station id
+@lru_cache(maxsize=256)
+def _fetch_station_info(station_id: str, session: requests.Session = None) -> dict:
+    query = urlencode({"stationReference": station_id})
+    return fetch_json(f"id/stations/?{query}", session=session)
+
+
+@lru_cache(maxsize=256)
+def _fetch_station_measures(
+    station_id: str, session: requests.Session = None
+) -> frozenset[str]:
+    data = fetch_json(f"id/stations/{station_id}/measures", session=session)
+    return frozenset(d["parameter"] for d in data["items"])
+
+
 def get_station_measurement_hist(
     station_id: str,
     start_end_date: tuple[datetime, datetime | None],
     measure_name: str = None,
+    session: requests.Session = None,
 ) -> dict:
 
     start_date, end_date = start_end_date
@@ -86,19 +122,18 @@ def get_station_measurement_hist(
         measure_name = measure_name.lower()
         assert measure_name in MEASURE_PARAMETER_NAMES
 
+    # Station info and list of measures avaliable from station are independent, so
+    # request both at once
+    station_info = _EXECUTOR.submit(_fetch_station_info, station_id, session)
+    station_measures = _EXECUTOR.submit(_fetch_station_measures, station_id, session)
+    station_info = station_info.result()
+    station_measures = station_measures.result()
+
     # Check station id is valid
-    endpoint = f"id/stations/?stationReference={station_id}"
-    station_info = create_session(endpoint)
     assert (
         len(station_info["items"]) > 0
     ), f"Station id: {station_id} not found! Ensure id is correct"
 
-    # List of measures avaliable from station
-    endpoint = f"id/stations/{station_id}/measures"
-    data = create_session(endpoint)
-    data = data["items"]
-
-    station_measures = {data[i]["parameter"] for i in range(len(data))}
     if measure_name is not None:
         assert (
             measure_name in station_measures
@@ -106,23 +141,23 @@ def get_station_measurement_hist(
 
     # Use start-end filter
     if end_date is not None:
-        s_date = dt_to_str(start_date, DATE_FORMAT)
-        e_date = dt_to_str(end_date, DATE_FORMAT)
-
-        endpoint = (
-            f"/id/stations/{station_id}/readings?startdate={s_date}&enddate={e_date}"
-        )
+        query = {
+            "startdate": start_date.strftime(DATE_FORMAT),
+            "enddate": end_date.strftime(DATE_FORMAT),
+        }
     # Use since filter
     else:
-        s_date = dt_to_str(start_date, DATETIME_FORMAT)
-        endpoint = f"/id/stations/{station_id}/readings?since={s_date}"
+        query = {"since": start_date.strftime(DATETIME_FORMAT)}
 
     if measure_name is not None:
-        endpoint += f"&parameter={measure_name}"
+        query["parameter"] = measure_name
+
+    endpoint = f"/id/stations/{station_id}/readings?{urlencode(query)}"
 
-    data = create_session(endpoint)
+    data = fetch_json(endpoint, session=session)
 
-    out = {"station": station_info, "readings": data}
+    # Station info is the cached response, so callers get their own copy to modify
+    out = {"station": deepcopy(station_info), "readings": data}
 
     return out
 
@@ -130,91 +165,88 @@ def get_station_measurement_hist(
 def get_station_measurement_hist_prev_24_hrs(
     station_id: str,
     measure_name: str = None,
+    session: requests.Session = None,
 ):
     return get_station_measurement_hist(
         station_id,
         start_end_date=(get_time_24hrs_ago(), None),
         measure_name=measure_name,
+        session=session,
     )
 
 
-def find_stations_by_parameter(parameter: str):
+def find_stations_by_parameter(parameter: str, session: requests.Session = None):
     assert parameter in MEASURE_PARAMETER_NAMES
     ext = f"id/stations?parameter={parameter}"
-    return create_session(ext)
-
-
-def post_process_readings(readings: dict):
+    return fetch_json(ext, session=session)
 
-    date_times, values = zip(
-        *[
-            (str_to_dt(d["dateTime"], DATETIME_FORMAT), d["value"])
-            for d in readings["items"]
-        ]
-    )
-
-    return date_times, values
 
+def create_measurement_df(readings: dict, variable_name: str = "Value") -> pd.DataFrame:
+    import pandas as pd
 
-def create_measurement_df(
-    dates: list[datetime], values: list[float], variable_name: str = "Value"
-) -> pd.DataFrame:
-    df = pd.DataFrame({"Date": dates, variable_name: values})
-    df["Date"] = pd.to_datetime(df["Date"], format=DATE_FORMAT)
-    df = df.sort_values(by="Date")
+    # Items are passed to pandas as they are and the ISO 8601 date strings parsed in
+    # C, rather than first unpacking each reading in Python
+    df = pd.DataFrame(readings["items"], columns=["dateTime", "value"])
+    df["dateTime"] = pd.to_datetime(df["dateTime"], format="ISO8601", utc=True)
+    df.rename(columns={"dateTime": "Date", "value": variable_name}, inplace=True)
+    df.sort_values("Date", inplace=True, ignore_index=True)
 
     return df
 
 
 def plot_data(
-    data: pd.DataFrame, title: str = "Test", variable_to_plot: str = "Value"
+    dates: np.ndarray, values: np.ndarray, title: str = "Test", ylabel: str = "Value"
 ) -> None:
-
-    plt.figure(figsize=(12, 7), dpi=100)
-
-    plt.plot(
-        data["Date"],
-        data[variable_to_plot],
-        "-",
+    import matplotlib.pyplot as plt
+    import matplotlib.dates as mdates
+    import numpy as np
+
+    fig, ax = plt.subplots(figsize=(12, 7), dpi=100)
+
+    # Line and markers drawn as a single artist. Markers only highlight ~10 evenly
+    # spaced readings so their count doesn't grow with the series, and the line is
+    # rasterized when saved to vector formats
+    ax.plot(
+        dates,
+        values,
+        "-o",
         color="#3366cc",
         linewidth=2.5,
+        markersize=8,
+        markevery=max(1, len(values) // 10),
         alpha=0.8,
+        rasterized=True,
     )
-    plt.scatter(
-        data["Date"],
-        data[variable_to_plot],
-        color="#3366cc",
-        s=60,
-        alpha=0.7,
-        edgecolors="white",
-        linewidth=1.5,
-    )
-    plt.fill_between(data["Date"], data[variable_to_plot], color="#3366cc", alpha=0.2)
 
-    plt.grid(True, linestyle="--", alpha=0.7, color="#cccccc")
+    ax.grid(True, linestyle="--", alpha=0.7, color="#cccccc")
 
-    plt.gca().set_facecolor("#f8f9fa")
-    plt.gcf().patch.set_facecolor("#f8f9fa")
+    # Few major ticks and no minor ticks, tick count dominates draw time. Same as
+    # plotting.set_date_ticks, repeated as this script doesn't import the package
+    locator = mdates.AutoDateLocator(minticks=3, maxticks=7)
+    ax.xaxis.set_major_locator(locator)
+    ax.xaxis.set_major_formatter(mdates.AutoDateFormatter(locator))
+    ax.minorticks_off()
 
-    plt.gcf().autofmt_xdate()
+    ax.set_facecolor("#f8f9fa")
+    fig.patch.set_facecolor("#f8f9fa")
 
     # Add labels and title with custom styling
-    plt.xlabel("Date", fontsize=12, fontweight="bold", labelpad=10)
-    plt.ylabel(variable_to_plot, fontsize=12, fontweight="bold", labelpad=10)
-    plt.title(title, fontsize=16, fontweight="bold", pad=20)
-
-    plt.box(True)
-    plt.gca().spines["top"].set_visible(False)
-    plt.gca().spines["right"].set_visible(False)
-    plt.gca().spines["left"].set_color("#555555")
-    plt.gca().spines["bottom"].set_color("#555555")
-
-    max_value_idx = data[variable_to_plot].idxmax()
-    min_value_idx = data[variable_to_plot].idxmin()
-
-    plt.annotate(
-        f"Max: {data[variable_to_plot].max():.1f}",
-        xy=(data["Date"][max_value_idx], data[variable_to_plot][max_value_idx]),
+    ax.set_xlabel("Date", fontsize=12, fontweight="bold", labelpad=10)
+    ax.set_ylabel(ylabel, fontsize=12, fontweight="bold", labelpad=10)
+    ax.set_title(title, fontsize=16, fontweight="bold", pad=20)
+
+    ax.spines["top"].set_visible(False)
+    ax.spines["right"].set_visible(False)
+    ax.spines["left"].set_color("#555555")
+    ax.spines["bottom"].set_color("#555555")
+
+    # Missing readings are NaN so are skipped when locating the extremes
+    max_value_idx = np.nanargmax(values)
+    min_value_idx = np.nanargmin(values)
+
+    ax.annotate(
+        f"Max: {values[max_value_idx]:.1f}",
+        xy=(dates[max_value_idx], values[max_value_idx]),
         xytext=(10, 15),
         textcoords="offset points",
         arrowprops=dict(
@@ -226,9 +258,9 @@ def plot_data(
         bbox=dict(boxstyle="round,pad=0.3", fc="white", alpha=0.7),
     )
 
-    plt.annotate(
-        f"Min: {data[variable_to_plot].min():.1f}",
-        xy=(data["Date"][min_value_idx], data[variable_to_plot][min_value_idx]),
+    ax.annotate(
+        f"Min: {values[min_value_idx]:.1f}",
+        xy=(dates[min_value_idx], values[min_value_idx]),
         xytext=(10, -25),
         textcoords="offset points",
         arrowprops=dict(
@@ -240,15 +272,31 @@ def plot_data(
         bbox=dict(boxstyle="round,pad=0.3", fc="white", alpha=0.7),
     )
 
-    plt.tight_layout()
+    # Rotate date labels once all artists are added, then lay out once
+    fig.autofmt_xdate()
+    fig.tight_layout()
     plt.show()
 
 
+def plot_data_from_df(
+    data: pd.DataFrame, title: str = "Test", variable_to_plot: str = "Value"
+) -> None:
+    # Dates are converted to naive UTC so numpy datetimes are passed, not objects
+    plot_data(
+        data["Date"].dt.tz_convert(None).to_numpy(),
+        data[variable_to_plot].to_numpy(),
+        title=title,
+        ylabel=variable_to_plot,
+    )
+
+
 if __name__ == "__main__":
+    # Show this script's request logging without debug output from other libraries
+    logging.basicConfig(level=logging.INFO)
+    logger.setLevel(logging.DEBUG)
 
     param = "flow"
     data = get_station_measurement_hist_prev_24_hrs("E2534", measure_name=param)
 
-    dates, values = post_process_readings(data["readings"])
-    df = create_measurement_df(dates, values, variable_name=param)
-    plot_data(df, variable_to_plot="flow")
+    df = create_measurement_df(data["readings"], variable_name=param)
+    plot_data_from_df(df, variable_to_plot=param)
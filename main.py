@@ -7,6 +7,7 @@ Created on Wed Mar  5 21:58:26 2025
 Main entry for CLI interface for EA API.
 """
 
+import logging
 from collections import namedtuple
 from cli import (
     search_stations_by_name,
@@ -43,6 +44,11 @@ CHOICE_MAPPINGS = {
     "7": UserChoice(display_measure_types, "List all valid types of measures"),
     "8": UserChoice(lambda x: exit, "Exit"),
 }
+
+# Menu never changes so is built once and printed in a single write
+MENU_TEXT = "\nOptions:\n" + "\n".join(
+    f"{k}: {v.description}" for k, v in CHOICE_MAPPINGS.items()
+)
 # ============================================================================= #
 
 
@@ -51,11 +57,13 @@ def main():
     """Implemnts CL interface for interacting with APIClinet.
     Lets user select from options provided in CHOICE_MAPPING"""
 
+    # Request logging from APIClient is at DEBUG so is hidden by default
+    logging.basicConfig(level=logging.INFO)
+
     api_client = APIClient()
 
     while True:
-        print("\nOptions:")
-        [print(f"{k}: {v.description}") for k, v in CHOICE_MAPPINGS.items()]
+        print(MENU_TEXT)
 
         max_choice = len(CHOICE_MAPPINGS) + 1
         choice = input(f"Enter your choice (1-{max_choice}): ").strip()
@@ -4,75 +4,80 @@ Created on Wed Mar  5 23:26:35 2025
 
 @author: Dilaksan Thillaithevan
 """
-from pandas import DataFrame
-import pandas as pd
-import matplotlib.pyplot as plt
+from __future__ import annotations
+from typing import TYPE_CHECKING
+
+# matplotlib is slow to import and only needed once a plot is drawn, so plotting
+# libraries are imported inside the functions that use them
+if TYPE_CHECKING:
+    from pandas import DataFrame
+
+
+# =============================================================================
+def set_date_ticks(ax) -> None:
+    """Limits date x-axis to a handful of major ticks and no minor ticks, as tick
+    count dominates draw time for dense time series"""
+    import matplotlib.dates as mdates
+
+    locator = mdates.AutoDateLocator(minticks=3, maxticks=7)
+    ax.xaxis.set_major_locator(locator)
+    ax.xaxis.set_major_formatter(mdates.AutoDateFormatter(locator))
+    ax.minorticks_off()
+
+
+# =============================================================================
 
 
 # =============================================================================
 def plot_time_series(df: DataFrame, measurement_info: dict):
     """ """
+    import matplotlib.pyplot as plt
+    import numpy as np
+    import pandas as pd
+
     df.iloc[:, 0] = pd.to_datetime(df.iloc[:, 0])
     df.set_index(df.columns[0], inplace=True)
 
     num_cols = len(df.columns)
-    start_date = df.index.min().strftime("%d-%m-%Y")
-    end_date = df.index.max().strftime("%d-%m-%Y")
+    # Index is sorted so the date range is its first and last entries. Both are
+    # formatted in one numpy call then rearranged from YYYY-MM-DD to DD-MM-YYYY
+    start_date, end_date = (
+        f"{d[8:10]}-{d[5:7]}-{d[:4]}"
+        for d in np.datetime_as_string(df.index.values[[0, -1]], unit="D")
+    )
 
-    num_cols = len(df.columns)
+    y_labels = {
+        col: f"{measurement_info[col]['measurement_name']} - {measurement_info[col]['qualifier']} ({measurement_info[col]['unit']})"
+        for col in df.columns
+    }
 
-    if num_cols == 1:
-        col_name = df.columns[0]
-        # col_name += f" ({measurement_info[col_name]['unit']}, {measurement_info[col_name]['qualifier']})"
-        fig, ax = plt.subplots(figsize=(10, 5))
-        ax.plot(df.index, df.iloc[:, 0], label=col_name)
-        y_label = (
-            measurement_info[col_name]["measurement_name"]
-            + " - "
-            + measurement_info[col_name]["qualifier"]
-            + " ("
-            + measurement_info[col_name]["unit"]
-            + ")"
-        )
-        ax.set_ylabel(y_label)
-        ax.set_title(f"{col_name} ({start_date} - {end_date})")
-        ax.grid(True, linestyle="--", alpha=0.7, color="#cccccc")
-        ax.spines[["right", "top"]].set_visible(False)
-        ax.spines["left"].set_color("#555555")
-        ax.spines["bottom"].set_color("#555555")
-
-    else:
-        fig, axes = plt.subplots(num_cols, 1, figsize=(10, 5 * num_cols), sharex=True)
+    fig, axes = plt.subplots(
+        num_cols, 1, figsize=(10, 5 * num_cols), sharex=True, squeeze=False
+    )
 
+    for ax, col in zip(axes[:, 0], df.columns):
+        ax.plot(df.index, df[col], label=col)
+        ax.set_ylabel(y_labels[col])
         if num_cols == 1:
-            axes = [axes]
-
-        for ax, col in zip(axes, df.columns):
-            ax.plot(df.index, df[col], label=col)
-            y_label = (
-                measurement_info[col]["measurement_name"]
-                + " - "
-                + measurement_info[col]["qualifier"]
-                + " ("
-                + measurement_info[col]["unit"]
-                + ")"
-            )
-            ax.set_ylabel(y_label)
-            ax.set_xlabel("Date")
+            ax.set_title(f"{col} ({start_date} - {end_date})")
+        else:
             ax.set_title(f"{col}")
             ax.legend()
-            ax.grid(True, linestyle="--", alpha=0.7, color="#cccccc")
-            ax.spines["left"].set_color("#555555")
-            ax.spines["bottom"].set_color("#555555")
-            ax.spines[["right", "top"]].set_visible(False)
+        ax.grid(True, linestyle="--", alpha=0.7, color="#cccccc")
+        ax.spines[["right", "top"]].set_visible(False)
+        ax.spines["left"].set_color("#555555")
+        ax.spines["bottom"].set_color("#555555")
 
-    plt.gca().set_facecolor("#f8f9fa")
-    plt.gcf().patch.set_facecolor("#f8f9fa")
+    # x-axis is shared so only the bottom subplot needs labelling
+    axes[-1, 0].set_xlabel("Date")
+    set_date_ticks(axes[-1, 0])
 
-    plt.xticks(rotation=45)
-    plt.gcf().autofmt_xdate()
+    axes[-1, 0].set_facecolor("#f8f9fa")
+    fig.patch.set_facecolor("#f8f9fa")
 
-    plt.tight_layout()
+    # Rotate date labels once all axes are populated, then lay out once
+    fig.autofmt_xdate()
+    fig.tight_layout()
     plt.show()
 
 
@@ -5,7 +5,14 @@ Created on Mon Mar  3 20:17:04 2025
 @author: Dilaksan Thillaithevan
 """
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from typing import Any, Callable, Iterable
+
+try:
+    from orjson import loads as json_loads
+except ImportError:  # orjson is optional, stdlib json also accepts bytes
+    from json import loads as json_loads
 
 
 def get_time_24hrs_ago() -> datetime:
@@ -15,9 +22,14 @@ def get_time_24hrs_ago() -> datetime:
     return time_24_hours_ago
 
 
-def dt_to_str(dt: datetime, format: str) -> str:
-    return dt.strftime(format)
-
+def map_concurrently(
+    func: Callable, args: Iterable, max_workers: int = 16
+) -> list[Any]:
+    """Calls func on each of args using a thread pool (for I/O bound calls such as
+    API requests). Returns results in the same order as args"""
+    args = list(args)
+    if len(args) <= 1:
+        return [func(a) for a in args]
 
-def str_to_dt(dt_str: datetime, format: str) -> str:
-    return datetime.strptime(dt_str, format)
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(args))) as executor:
+        return list(executor.map(func, args))